@@ -11,9 +11,10 @@ Instructions:
    - 💵┇banque         (status of money will be shown/updated here)
    - 📦┇marchandises   (status of merch will be shown/updated here)
    - 📋┇historique     (all movement messages will be posted here)
-   You can change the names in the CONFIG section.
+   You can change the names in the CONFIG section, or set their IDs in CHANNEL_IDS.
 4) Install dependencies (requirements.txt):
    discord.py>=2.3.0
+   msgspec
 
 This script uses a local JSON file (data.json) for persistence so the data survives restarts on Replit.
 
@@ -35,503 +36,662 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 import asyncio
-import json
+import atexit
+import copy
+import msgspec
 import os
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import Optional
 
 # -------------------------------
 # Mini serveur web pour keep_alive
 # -------------------------------
-from flask import Flask
-from threading import Thread
+# Runs on the bot's event loop (started from on_ready), no extra thread needed
+from aiohttp import web
 
-app = Flask('')
+WEB_RUNNER = None
 
-@app.route('/')
-def home():
-    return "Bot actif !"
+async def home(request):
+    return web.Response(text="Bot actif !")
 
-def run():
-    app.run(host='0.0.0.0', port=8080)
-
-def keep_alive():
-    t = Thread(target=run)
-    t.start()
-
-# Lancer le serveur web
-keep_alive()
+async def _start_web():
+    global WEB_RUNNER
+    app = web.Application()
+    app.router.add_get('/', home)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host='0.0.0.0', port=8080).start()
+    except Exception as e:
+        await runner.cleanup()
+        print("Failed to start web server:", e)
+        return
+    WEB_RUNNER = runner
 
 
 # -------------------- CONFIG --------------------
 # Replace these with the actual Discord IDs of Alpha-1, Alpha-4, Alpha-5
-ALLOWED_USER_IDS = [549140350887788544, 428666981604917249, 621802427221278740]
+ALLOWED_USER_IDS = frozenset({549140350887788544, 428666981604917249, 621802427221278740})
 # Optional fallback by exact username#discrim (e.g. "Alpha-1#1234") - used only if IDs aren't configured
-ALLOWED_USER_NAMES = ["Alpha-1#0001", "Alpha-4#0004", "Alpha-5#0005"]
+ALLOWED_USER_NAMES = frozenset({"Alpha-1#0001", "Alpha-4#0004", "Alpha-5#0005"})
 
 # Channel names (must match server channels) - you can rename them here
 CHANNEL_CMD = "⚡┇cmds"
 CHANNEL_BANQUE = "💵┇banque"
 CHANNEL_MARCH = "📦┇marchandises"
 CHANNEL_HISTORY = "📋┇historique"
+# Optional channel IDs (Discord developer mode > right click > Copy ID).
+# Channels left to None are resolved once from the names above.
+CHANNEL_IDS = {"cmd": None, "banque": None, "march": None, "history": None}
+CHANNEL_NAMES = {"cmd": CHANNEL_CMD, "banque": CHANNEL_BANQUE, "march": CHANNEL_MARCH, "history": CHANNEL_HISTORY}
 
-DATA_FILE = "data.json"
-SAVE_LOCK = asyncio.Lock()
+# Thumbnail of the status embeds. Keep it free of the signed ex=/is=/hm= query
+# parameters Discord adds to attachment links: those expire after a while.
+THUMB_URL = "https://cdn.discordapp.com/attachments/1412715152947548282/1412715192604819478/image.png"
+
+# Above this many marchandises, the status embed uses a compact list instead of fields
+MAX_EMBED_FIELDS = 10
+MAX_EMBED_DESCRIPTION = 4096  # Discord embed description length limit
 
-# -------------------- DEFAULT DATA --------------------
-DEFAULT_DATA = {
-    "propre": 0,
-    "sale": 0,
-    "marchandises": {},
-    "status_message_ids": {"banque": None, "marchandises": None}
-}
+DATA_FILE = "data.json"
+# Single worker so that snapshots are written to disk in the order they were taken
+WRITE_EXECUTOR = ThreadPoolExecutor(max_workers=1)
+# Data is kept in memory and written to DATA_FILE at most every PERSIST_INTERVAL seconds
+PERSIST_INTERVAL = 10
+DATA_DIRTY = False
+
+# Per-guild resolved channel IDs: guild.id -> {"cmd"/"banque"/"march"/"history" -> channel id}
+GUILD_CHANNEL_IDS: dict[int, dict[str, int]] = {}
+# Per-guild status messages cache: guild.id -> (banque_msg, march_msg)
+STATUS_MSG_CACHE: dict[int, tuple[discord.Message, discord.Message]] = {}
+# Last state shown in each status message: message.id -> signature
+LAST_STATUS_SIG: dict[int, tuple] = {}
+
+# Status edits are coalesced: commands mark the affected status message dirty and a background
+# task flushes at most once every STATUS_FLUSH_DELAY seconds.
+STATUS_FLUSH_DELAY = 1.0
+STATUS_DIRTY = asyncio.Event()
+STATUS_PARTS = ("banque", "marchandises")
+DIRTY_STATUS: dict[int, set[str]] = {}  # guild.id -> status messages to update
+
+# History lines are queued and sent in batches by history_worker: a batch is
+# sent once it reaches HISTORY_BATCH_CHARS or HISTORY_FLUSH_DELAY seconds after its first line.
+HISTORY_FLUSH_DELAY = 2.0
+HISTORY_BATCH_CHARS = 1800
+HISTORY_MAX_MESSAGE = 2000  # Discord message length limit
+HISTORY_Q: asyncio.Queue = asyncio.Queue()  # (guild.id, line)
+HISTORY_PENDING: list[tuple[int, str]] = []  # batch being collected by history_worker
+
+# -------------------- DATA --------------------
+class State(msgspec.Struct):
+    propre: int = 0
+    sale: int = 0
+    marchandises: dict[str, int] = {}
+    status_message_ids: dict[str, Optional[int]] = msgspec.field(
+        default_factory=lambda: {"banque": None, "marchandises": None}
+    )
 
 # -------------------- HELPERS --------------------
 
 def load_data():
     if not os.path.exists(DATA_FILE):
-        with open(DATA_FILE, "w", encoding="utf-8") as f:
-            json.dump(DEFAULT_DATA, f, ensure_ascii=False, indent=2)
-        return DEFAULT_DATA.copy()
-    with open(DATA_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
+        data = State()
+        _write_data(data)
+        return data
+    with open(DATA_FILE, "rb") as f:
+        return msgspec.json.decode(f.read(), type=State)
+
+def _write_data(data):
+    # write to a temp file then rename it, so a crash never leaves a truncated data.json
+    tmp = DATA_FILE + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(msgspec.json.format(msgspec.json.encode(data), indent=2))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, DATA_FILE)
 
 async def save_data(data):
-    async with SAVE_LOCK:
-        with open(DATA_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+    # snapshot under the lock, then serialize and write off the event loop
+    async with DATA_LOCK:
+        snapshot = copy.deepcopy(data)
+    await asyncio.get_running_loop().run_in_executor(WRITE_EXECUTOR, _write_data, snapshot)
 
-def is_user_allowed(user: discord.Member):
-    # First check IDs
-    if user.id in ALLOWED_USER_IDS:
-        return True
-    # fallback: check username#discriminator
-    name_discrim = f"{user.name}#{user.discriminator}"
-    if name_discrim in ALLOWED_USER_NAMES:
-        return True
-    return False
+def mark_data_dirty():
+    global DATA_DIRTY
+    DATA_DIRTY = True
 
-async def get_channel_by_name(guild: discord.Guild, name: str):
-    for ch in guild.text_channels:
-        if ch.name == name:
-            return ch
-    return None
+async def flush_data():
+    """Write DATA to disk if it changed since the last flush."""
+    global DATA_DIRTY
+    if not DATA_DIRTY:
+        return
+    DATA_DIRTY = False
+    try:
+        await save_data(DATA)
+    except Exception:
+        # keep the changes pending so the next flush (or the atexit hook) retries
+        mark_data_dirty()
+        raise
+
+async def persist_loop():
+    while True:
+        await asyncio.sleep(PERSIST_INTERVAL)
+        try:
+            await flush_data()
+        except Exception as e:
+            print("Failed to save data:", e)
+
+@atexit.register
+def _flush_data_at_exit():
+    if DATA_DIRTY:
+        _write_data(DATA)
+
+def is_user_allowed(user: discord.Member):
+    # check IDs first; username#discriminator is only built as a fallback
+    return user.id in ALLOWED_USER_IDS or f"{user.name}#{user.discriminator}" in ALLOWED_USER_NAMES
+
+def resolve_channel_ids(guild: discord.Guild):
+    ids = {}
+    for key, name in CHANNEL_NAMES.items():
+        if CHANNEL_IDS.get(key):
+            ids[key] = CHANNEL_IDS[key]
+            continue
+        ch = discord.utils.get(guild.text_channels, name=name)
+        if ch:
+            ids[key] = ch.id
+    old_ids = GUILD_CHANNEL_IDS.get(guild.id, {})
+    if any(old_ids.get(key) != ids.get(key) for key in ("banque", "march")):
+        # status messages live in those channels: look them up again
+        STATUS_MSG_CACHE.pop(guild.id, None)
+    GUILD_CHANNEL_IDS[guild.id] = ids
+
+def get_channel(guild: discord.Guild, key: str):
+    channel_id = GUILD_CHANNEL_IDS.get(guild.id, {}).get(key)
+    return guild.get_channel(channel_id) if channel_id else None
+
+async def _get_or_create_status_message(chan: discord.TextChannel, data, key: str, placeholder: str):
+    msg = None
+    msg_id = data.status_message_ids.get(key)
+    if msg_id:
+        try:
+            msg = await chan.fetch_message(msg_id)
+        except Exception:
+            msg = None
+    if msg is None:
+        msg = await chan.send(placeholder)
+        data.status_message_ids[key] = msg.id
+        mark_data_dirty()
+    return msg
 
 async def ensure_status_messages(bot, guild, data):
     """Ensure that a status message exists in banque and marchandises channels and return them."""
-    chan_banque = await get_channel_by_name(guild, CHANNEL_BANQUE)
-    chan_march = await get_channel_by_name(guild, CHANNEL_MARCH)
+    chan_banque = get_channel(guild, "banque")
+    chan_march = get_channel(guild, "march")
     if chan_banque is None or chan_march is None:
         return None, None
 
-    # banque
-    banque_msg = None
-    bid = data.get("status_message_ids", {}).get("banque")
-    if bid:
-        try:
-            banque_msg = await chan_banque.fetch_message(bid)
-        except Exception:
-            banque_msg = None
-    if banque_msg is None:
-        banque_msg = await chan_banque.send("▶ Chargement des stats banque...")
-        data.setdefault("status_message_ids", {})["banque"] = banque_msg.id
-        await save_data(data)
-
-    # marchandises
-    march_msg = None
-    mid = data.get("status_message_ids", {}).get("marchandises")
-    if mid:
-        try:
-            march_msg = await chan_march.fetch_message(mid)
-        except Exception:
-            march_msg = None
-    if march_msg is None:
-        march_msg = await chan_march.send("▶ Chargement des stats marchandises...")
-        data.setdefault("status_message_ids", {})["marchandises"] = march_msg.id
-        await save_data(data)
+    banque_msg = await _get_or_create_status_message(chan_banque, data, "banque", "▶ Chargement des stats banque...")
+    march_msg = await _get_or_create_status_message(chan_march, data, "marchandises", "▶ Chargement des stats marchandises...")
 
+    STATUS_MSG_CACHE[guild.id] = (banque_msg, march_msg)
     return banque_msg, march_msg
 
-async def update_status_messages(banque_msg: discord.Message, march_msg: discord.Message, data):
-    # Update banque embed
-    embed_b = discord.Embed(title="Banque — États des fonds", timestamp=datetime.utcnow())
-    embed_b.set_thumbnail(url="https://cdn.discordapp.com/attachments/1412715152947548282/1412715192604819478/image.png?ex=68c52a8c&is=68c3d90c&hm=de03073e4d8e83b90bd99ab3e61ddadf8dca7aa185dab99918f97640b4c8f082&")
-    embed_b.add_field(name="Argent propre", value=f"{data.get('propre',0):,} $", inline=True)
-    embed_b.add_field(name="Argent sale", value=f"{data.get('sale',0):,} $", inline=True)
-    embed_b.set_footer(text="Dernière mise à jour")
+async def _edit_status(msg: discord.Message, embed: discord.Embed, sig):
+    """Edit a status message. Returns False if it was deleted on Discord."""
     try:
-        await banque_msg.edit(content=None, embed=embed_b)
+        await msg.edit(content=None, embed=embed)
+    except discord.NotFound:
+        return False
     except Exception:
-        pass
+        return True
+    LAST_STATUS_SIG[msg.id] = sig
+    return True
 
-    # Update marchandises embed
+async def update_banque(banque_msg: discord.Message, data):
+    sig = (data.propre, data.sale)
+    if LAST_STATUS_SIG.get(banque_msg.id) == sig:
+        return True
+    embed_b = discord.Embed(title="Banque — États des fonds", timestamp=datetime.utcnow())
+    embed_b.set_thumbnail(url=THUMB_URL)
+    embed_b.add_field(name="Argent propre", value=f"{data.propre:,} $", inline=True)
+    embed_b.add_field(name="Argent sale", value=f"{data.sale:,} $", inline=True)
+    embed_b.set_footer(text="Dernière mise à jour")
+    return await _edit_status(banque_msg, embed_b, sig)
+
+def _marchandises_description(merch: dict[str, int]):
+    """One line per marchandise, cut to fit in an embed description."""
+    lines = []
+    size = 0
+    for i, (name, qty) in enumerate(merch.items()):
+        line = f"**{name}**: {qty}"
+        suffix = f"\n+{len(merch) - i - 1} autres" if i < len(merch) - 1 else ""
+        # always keep room for the "+N autres" line
+        if size + len(line) + len(suffix) + 1 > MAX_EMBED_DESCRIPTION:
+            lines.append(f"+{len(merch) - i} autres")
+            break
+        lines.append(line)
+        size += len(line) + 1
+    return "\n".join(lines)
+
+async def update_marchandises(march_msg: discord.Message, data):
+    merch = data.marchandises
+    sig = tuple(merch.items())
+    if LAST_STATUS_SIG.get(march_msg.id) == sig:
+        return True
     embed_m = discord.Embed(title="Marchandises — Stocks", timestamp=datetime.utcnow())
-    embed_m.set_thumbnail(url="https://cdn.discordapp.com/attachments/1412715152947548282/1412715192604819478/image.png?ex=68c52a8c&is=68c3d90c&hm=de03073e4d8e83b90bd99ab3e61ddadf8dca7aa185dab99918f97640b4c8f082&")
-    merch = data.get("marchandises", {})
-    if merch:
+    embed_m.set_thumbnail(url=THUMB_URL)
+    if len(merch) > MAX_EMBED_FIELDS:
+        # Discord caps embeds at 25 fields: list large stocks in the description instead
+        embed_m.description = _marchandises_description(merch)
+    elif merch:
         for name, qty in merch.items():
             embed_m.add_field(name=name, value=str(qty), inline=True)
     else:
         embed_m.description = "Aucune marchandise enregistrée"
     embed_m.set_footer(text="Dernière mise à jour")
-    try:
-        await march_msg.edit(content=None, embed=embed_m)
-    except Exception:
-        pass
-
-async def post_history(guild: discord.Guild, message_text: str):
-    ch = await get_channel_by_name(guild, CHANNEL_HISTORY)
-    if ch:
-        await ch.send(message_text)
+    return await _edit_status(march_msg, embed_m, sig)
+
+async def _update_status(msgs, parts):
+    banque_msg, march_msg = msgs
+    found = True
+    if "banque" in parts:
+        found = await update_banque(banque_msg, DATA) and found
+    if "marchandises" in parts:
+        found = await update_marchandises(march_msg, DATA) and found
+    return found
+
+async def _refresh_status(guild: discord.Guild, parts=STATUS_PARTS):
+    """Update the given status messages of a guild, using the cached message objects."""
+    msgs = STATUS_MSG_CACHE.get(guild.id)
+    if msgs is None:
+        msgs = await ensure_status_messages(bot, guild, DATA)
+        if not all(msgs):
+            return
+    if not await _update_status(msgs, parts):
+        # a status message was deleted: recreate it
+        STATUS_MSG_CACHE.pop(guild.id, None)
+        msgs = await ensure_status_messages(bot, guild, DATA)
+        if all(msgs):
+            await _update_status(msgs, parts)
+
+def mark_status_dirty(guild: discord.Guild, *parts: str):
+    DIRTY_STATUS.setdefault(guild.id, set()).update(parts)
+    STATUS_DIRTY.set()
+
+async def status_flusher():
+    while True:
+        await STATUS_DIRTY.wait()
+        await asyncio.sleep(STATUS_FLUSH_DELAY)
+        STATUS_DIRTY.clear()
+        dirty = dict(DIRTY_STATUS)
+        DIRTY_STATUS.clear()
+        for guild_id, parts in dirty.items():
+            guild = bot.get_guild(guild_id)
+            if guild is None:
+                continue
+            try:
+                await _refresh_status(guild, parts)
+            except Exception as e:
+                print("Failed to update status messages:", e)
+
+def post_history(guild: discord.Guild, message_text: str):
+    HISTORY_Q.put_nowait((guild.id, message_text))
+
+async def _send_history(guild_id: int, lines: list[str]):
+    guild = bot.get_guild(guild_id)
+    ch = get_channel(guild, "history") if guild else None
+    if ch is None:
+        return
+    # pack as many lines as possible into each message, splitting lines that are too long
+    chunks = []
+    chunk = ""
+    for line in lines:
+        for i in range(0, len(line), HISTORY_MAX_MESSAGE):
+            part = line[i:i + HISTORY_MAX_MESSAGE]
+            if chunk and len(chunk) + 1 + len(part) > HISTORY_MAX_MESSAGE:
+                chunks.append(chunk)
+                chunk = part
+            else:
+                chunk = f"{chunk}\n{part}" if chunk else part
+    if chunk:
+        chunks.append(chunk)
+    for chunk in chunks:
+        try:
+            await ch.send(chunk)
+        except Exception as e:
+            print("Failed to post history:", e)
+
+async def _send_history_batch(batch: list[tuple[int, str]]):
+    lines_by_guild: dict[int, list[str]] = {}
+    for guild_id, line in batch:
+        lines_by_guild.setdefault(guild_id, []).append(line)
+    for guild_id, lines in lines_by_guild.items():
+        await _send_history(guild_id, lines)
+
+async def history_worker():
+    loop = asyncio.get_running_loop()
+    while True:
+        HISTORY_PENDING.append(await HISTORY_Q.get())
+        size = len(HISTORY_PENDING[0][1])
+        deadline = loop.time() + HISTORY_FLUSH_DELAY
+        while size < HISTORY_BATCH_CHARS:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(HISTORY_Q.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            HISTORY_PENDING.append(item)
+            size += len(item[1]) + 1
+        await _send_history_batch(HISTORY_PENDING)
+        HISTORY_PENDING.clear()
+
+async def flush_history():
+    """Send every queued history line right away (used on shutdown)."""
+    # a batch interrupted while being sent is sent again in full: duplicates beat lost lines
+    if HISTORY_TASK is not None:
+        HISTORY_TASK.cancel()
+    batch = list(HISTORY_PENDING)
+    HISTORY_PENDING.clear()
+    while not HISTORY_Q.empty():
+        batch.append(HISTORY_Q.get_nowait())
+    await _send_history_batch(batch)
 
 # -------------------- BOT SETUP --------------------
 intents = discord.Intents.default()
 intents.message_content = False  # we use slash commands
-bot = commands.Bot(command_prefix="!", intents=intents)
+class GestionBot(commands.Bot):
+    async def setup_hook(self):
+        # Replit / Procfile hosts stop the bot with SIGTERM, which Client.run doesn't
+        # handle: close cleanly so pending data and history are flushed
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, self._on_sigterm)
+        except (NotImplementedError, RuntimeError):
+            pass  # signal handlers aren't available on Windows event loops
+
+    def _on_sigterm(self):
+        self._close_task = asyncio.create_task(self.close())
+
+    async def close(self):
+        # make sure pending changes hit the disk before shutting down; each step is
+        # guarded so a failure can't skip the others or the actual disconnect
+        try:
+            await flush_data()
+        except Exception as e:
+            print("Failed to save data:", e)
+        try:
+            await flush_history()
+        except Exception as e:
+            print("Failed to post history:", e)
+        if WEB_RUNNER is not None:
+            try:
+                await WEB_RUNNER.cleanup()
+            except Exception as e:
+                print("Failed to stop web server:", e)
+        await super().close()
+
+bot = GestionBot(command_prefix="!", intents=intents)
 
 # We'll store loaded data globally
 DATA = load_data()
 DATA_LOCK = asyncio.Lock()
+STATUS_TASK = None
+HISTORY_TASK = None
+PERSIST_TASK = None
+WEB_TASK = None
 
 @bot.event
 async def on_ready():
+    global STATUS_TASK, HISTORY_TASK, PERSIST_TASK, WEB_TASK
     print(f"Logged in as {bot.user} (ID: {bot.user.id})")
+    # on_ready can fire again after a reconnect: only start the background tasks once.
+    # Start them first so a failing guild below can't prevent data from being saved.
+    if STATUS_TASK is None or STATUS_TASK.done():
+        STATUS_TASK = bot.loop.create_task(status_flusher())
+    if HISTORY_TASK is None or HISTORY_TASK.done():
+        HISTORY_TASK = bot.loop.create_task(history_worker())
+    if PERSIST_TASK is None or PERSIST_TASK.done():
+        PERSIST_TASK = bot.loop.create_task(persist_loop())
+    # Lancer le serveur web
+    if WEB_RUNNER is None and (WEB_TASK is None or WEB_TASK.done()):
+        WEB_TASK = bot.loop.create_task(_start_web())
     # For each guild the bot is in, ensure status messages exist and update them
     for guild in bot.guilds:
-        banque_msg, march_msg = await ensure_status_messages(bot, guild, DATA)
-        if banque_msg and march_msg:
-            await update_status_messages(banque_msg, march_msg, DATA)
+        resolve_channel_ids(guild)
+        try:
+            await _refresh_status(guild)
+        except Exception as e:
+            print("Failed to update status messages:", e)
     try:
         synced = await bot.tree.sync()
         print(f"Synced {len(synced)} commands")
     except Exception as e:
         print("Failed to sync commands:", e)
 
+# Re-resolve channel IDs when channels are created, renamed or deleted
+@bot.event
+async def on_guild_join(guild):
+    resolve_channel_ids(guild)
+
+@bot.event
+async def on_guild_channel_create(channel):
+    if isinstance(channel, discord.TextChannel):
+        resolve_channel_ids(channel.guild)
+
+@bot.event
+async def on_guild_channel_delete(channel):
+    if isinstance(channel, discord.TextChannel):
+        resolve_channel_ids(channel.guild)
+
+@bot.event
+async def on_guild_channel_update(before, after):
+    if isinstance(after, discord.TextChannel) and before.name != after.name:
+        resolve_channel_ids(after.guild)
+
 # -------------------- PERMISSION CHECK --------------------
-async def check_allowed_and_channel(interaction: discord.Interaction):
-    # allowed user
-    if not is_user_allowed(interaction.user):
-        await interaction.response.send_message("❌ Vous n'êtes pas autorisé à utiliser cette commande.", ephemeral=True)
-        return False
-    # channel check
-    if interaction.channel is None or interaction.channel.name != CHANNEL_CMD:
-        await interaction.response.send_message(f"❌ Les commandes doivent être utilisées dans le salon #{CHANNEL_CMD}.", ephemeral=True)
-        return False
-    return True
+class CommandRejected(app_commands.CheckFailure):
+    """Raised by the permission check; its message is sent back to the user."""
+
+def allowed_and_in_cmds():
+    async def predicate(interaction: discord.Interaction):
+        # allowed user
+        if not is_user_allowed(interaction.user):
+            raise CommandRejected("❌ Vous n'êtes pas autorisé à utiliser cette commande.")
+        # channel check
+        if interaction.guild is None or interaction.channel_id != GUILD_CHANNEL_IDS.get(interaction.guild.id, {}).get("cmd"):
+            raise CommandRejected(f"❌ Les commandes doivent être utilisées dans le salon #{CHANNEL_CMD}.")
+        # acknowledge right away: commands then answer through interaction.followup
+        await interaction.response.defer()
+        return True
+    return app_commands.check(predicate)
+
+@bot.tree.error
+async def on_app_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
+    if isinstance(error, CommandRejected):
+        await interaction.response.send_message(str(error), ephemeral=True)
+        return
+    if interaction.response.is_done():
+        # the interaction was deferred by the check: resolve the "thinking…" message
+        try:
+            await interaction.followup.send("❌ Une erreur est survenue lors de l'exécution de la commande.", ephemeral=True)
+        except Exception:
+            pass
+    await app_commands.CommandTree.on_error(bot.tree, interaction, error)
 
 # -------------------- COMMANDS --------------------
 
 @bot.tree.command(name="propre_in", description="Entrée d'argent propre")
+@allowed_and_in_cmds()
 @app_commands.describe(montant="Montant en $")
 async def propre_in(interaction: discord.Interaction, montant: int):
-    if not await check_allowed_and_channel(interaction):
-        return
     async with DATA_LOCK:
-        DATA['propre'] = DATA.get('propre', 0) + montant
-        await save_data(DATA)
-    await interaction.response.send_message(f"✅ Ajouté {montant:,} $ à l'argent propre.")
+        DATA.propre += montant
+        mark_data_dirty()
+    await interaction.followup.send(f"✅ Ajouté {montant:,} $ à l'argent propre.")
     # log
-    await post_history(interaction.guild, f"[{datetime.utcnow().isoformat()}] {interaction.user} a ajouté {montant:,} $ à l'argent propre")
+    post_history(interaction.guild, f"<t:{int(time.time())}:F> {interaction.user} a ajouté {montant:,} $ à l'argent propre")
     # update status
-    banque_msg = None
-    try:
-        chan_b = await get_channel_by_name(interaction.guild, CHANNEL_BANQUE)
-        if chan_b:
-            bid = DATA.get('status_message_ids', {}).get('banque')
-            if bid:
-                banque_msg = await chan_b.fetch_message(bid)
-    except Exception:
-        banque_msg = None
-    march_msg = None
-    try:
-        chan_m = await get_channel_by_name(interaction.guild, CHANNEL_MARCH)
-        if chan_m:
-            mid = DATA.get('status_message_ids', {}).get('marchandises')
-            if mid:
-                march_msg = await chan_m.fetch_message(mid)
-    except Exception:
-        march_msg = None
-    if banque_msg and march_msg:
-        await update_status_messages(banque_msg, march_msg, DATA)
+    mark_status_dirty(interaction.guild, "banque")
 
 @bot.tree.command(name="propre_out", description="Sortie d'argent propre")
+@allowed_and_in_cmds()
 @app_commands.describe(montant="Montant en $")
 async def propre_out(interaction: discord.Interaction, montant: int):
-    if not await check_allowed_and_channel(interaction):
-        return
     async with DATA_LOCK:
-        DATA['propre'] = max(0, DATA.get('propre', 0) - montant)
-        await save_data(DATA)
-    await interaction.response.send_message(f"✅ Retiré {montant:,} $ de l'argent propre.")
-    await post_history(interaction.guild, f"[{datetime.utcnow().isoformat()}] {interaction.user} a retiré {montant:,} $ de l'argent propre")
+        DATA.propre = max(0, DATA.propre - montant)
+        mark_data_dirty()
+    await interaction.followup.send(f"✅ Retiré {montant:,} $ de l'argent propre.")
+    post_history(interaction.guild, f"<t:{int(time.time())}:F> {interaction.user} a retiré {montant:,} $ de l'argent propre")
     # update status
-    for _ in range(1):
-        pass
-    banque_msg = None
-    try:
-        chan_b = await get_channel_by_name(interaction.guild, CHANNEL_BANQUE)
-        if chan_b:
-            bid = DATA.get('status_message_ids', {}).get('banque')
-            if bid:
-                banque_msg = await chan_b.fetch_message(bid)
-    except Exception:
-        banque_msg = None
-    march_msg = None
-    try:
-        chan_m = await get_channel_by_name(interaction.guild, CHANNEL_MARCH)
-        if chan_m:
-            mid = DATA.get('status_message_ids', {}).get('marchandises')
-            if mid:
-                march_msg = await chan_m.fetch_message(mid)
-    except Exception:
-        march_msg = None
-    if banque_msg and march_msg:
-        await update_status_messages(banque_msg, march_msg, DATA)
+    mark_status_dirty(interaction.guild, "banque")
 
 @bot.tree.command(name="sale_in", description="Entrée d'argent sale")
+@allowed_and_in_cmds()
 @app_commands.describe(montant="Montant en $")
 async def sale_in(interaction: discord.Interaction, montant: int):
-    if not await check_allowed_and_channel(interaction):
-        return
     async with DATA_LOCK:
-        DATA['sale'] = DATA.get('sale', 0) + montant
-        await save_data(DATA)
-    await interaction.response.send_message(f"✅ Ajouté {montant:,} $ à l'argent sale.")
-    await post_history(interaction.guild, f"[{datetime.utcnow().isoformat()}] {interaction.user} a ajouté {montant:,} $ à l'argent sale")
+        DATA.sale += montant
+        mark_data_dirty()
+    await interaction.followup.send(f"✅ Ajouté {montant:,} $ à l'argent sale.")
+    post_history(interaction.guild, f"<t:{int(time.time())}:F> {interaction.user} a ajouté {montant:,} $ à l'argent sale")
     # update status
-    chan_b = await get_channel_by_name(interaction.guild, CHANNEL_BANQUE)
-    banque_msg = None
-    try:
-        if chan_b:
-            bid = DATA.get('status_message_ids', {}).get('banque')
-            if bid:
-                banque_msg = await chan_b.fetch_message(bid)
-    except Exception:
-        banque_msg = None
-    chan_m = await get_channel_by_name(interaction.guild, CHANNEL_MARCH)
-    march_msg = None
-    try:
-        if chan_m:
-            mid = DATA.get('status_message_ids', {}).get('marchandises')
-            if mid:
-                march_msg = await chan_m.fetch_message(mid)
-    except Exception:
-        march_msg = None
-    if banque_msg and march_msg:
-        await update_status_messages(banque_msg, march_msg, DATA)
+    mark_status_dirty(interaction.guild, "banque")
 
 @bot.tree.command(name="sale_out", description="Sortie d'argent sale")
+@allowed_and_in_cmds()
 @app_commands.describe(montant="Montant en $")
 async def sale_out(interaction: discord.Interaction, montant: int):
-    if not await check_allowed_and_channel(interaction):
-        return
     async with DATA_LOCK:
-        DATA['sale'] = max(0, DATA.get('sale', 0) - montant)
-        await save_data(DATA)
-    await interaction.response.send_message(f"✅ Retiré {montant:,} $ de l'argent sale.")
-    await post_history(interaction.guild, f"[{datetime.utcnow().isoformat()}] {interaction.user} a retiré {montant:,} $ de l'argent sale")
+        DATA.sale = max(0, DATA.sale - montant)
+        mark_data_dirty()
+    await interaction.followup.send(f"✅ Retiré {montant:,} $ de l'argent sale.")
+    post_history(interaction.guild, f"<t:{int(time.time())}:F> {interaction.user} a retiré {montant:,} $ de l'argent sale")
     # update status
-    chan_b = await get_channel_by_name(interaction.guild, CHANNEL_BANQUE)
-    banque_msg = None
-    try:
-        if chan_b:
-            bid = DATA.get('status_message_ids', {}).get('banque')
-            if bid:
-                banque_msg = await chan_b.fetch_message(bid)
-    except Exception:
-        banque_msg = None
-    chan_m = await get_channel_by_name(interaction.guild, CHANNEL_MARCH)
-    march_msg = None
-    try:
-        if chan_m:
-            mid = DATA.get('status_message_ids', {}).get('marchandises')
-            if mid:
-                march_msg = await chan_m.fetch_message(mid)
-    except Exception:
-        march_msg = None
-    if banque_msg and march_msg:
-        await update_status_messages(banque_msg, march_msg, DATA)
+    mark_status_dirty(interaction.guild, "banque")
 
 # -------------------- MARCHANDISES --------------------
 
 @bot.tree.command(name="new_marchandise", description="Ajouter un nouveau type de marchandise")
+@allowed_and_in_cmds()
 @app_commands.describe(nom="Nom de la marchandise à ajouter")
 async def new_marchandise(interaction: discord.Interaction, nom: str):
-    if not await check_allowed_and_channel(interaction):
-        return
     async with DATA_LOCK:
-        merch = DATA.setdefault('marchandises', {})
-        if nom in merch:
-            await interaction.response.send_message(f"⚠️ La marchandise `{nom}` existe déjà.")
-            return
-        merch[nom] = 0
-        await save_data(DATA)
-    await interaction.response.send_message(f"✅ Marchandise `{nom}` ajoutée avec quantité 0.")
-    await post_history(interaction.guild, f"[{datetime.utcnow().isoformat()}] {interaction.user} a ajouté la marchandise `{nom}`")
+        merch = DATA.marchandises
+        exists = nom in merch
+        if not exists:
+            merch[nom] = 0
+            mark_data_dirty()
+    if exists:
+        await interaction.followup.send(f"⚠️ La marchandise `{nom}` existe déjà.")
+        return
+    await interaction.followup.send(f"✅ Marchandise `{nom}` ajoutée avec quantité 0.")
+    post_history(interaction.guild, f"<t:{int(time.time())}:F> {interaction.user} a ajouté la marchandise `{nom}`")
     # update status
-    chan_b = await get_channel_by_name(interaction.guild, CHANNEL_BANQUE)
-    chan_m = await get_channel_by_name(interaction.guild, CHANNEL_MARCH)
-    try:
-        banque_msg = await chan_b.fetch_message(DATA.get('status_message_ids', {}).get('banque')) if chan_b else None
-        march_msg = await chan_m.fetch_message(DATA.get('status_message_ids', {}).get('marchandises')) if chan_m else None
-    except Exception:
-        banque_msg = march_msg = None
-    if banque_msg and march_msg:
-        await update_status_messages(banque_msg, march_msg, DATA)
+    mark_status_dirty(interaction.guild, "marchandises")
 
 @bot.tree.command(name="delete_marchandise", description="Supprimer une marchandise et son stock")
+@allowed_and_in_cmds()
 @app_commands.describe(nom="Nom de la marchandise à supprimer")
 async def delete_marchandise(interaction: discord.Interaction, nom: str):
-    if not await check_allowed_and_channel(interaction):
-        return
     async with DATA_LOCK:
-        merch = DATA.setdefault('marchandises', {})
-        if nom not in merch:
-            await interaction.response.send_message(f"⚠️ La marchandise `{nom}` n'existe pas.")
-            return
-        del merch[nom]
-        await save_data(DATA)
-    await interaction.response.send_message(f"✅ Marchandise `{nom}` supprimée.")
-    await post_history(interaction.guild, f"[{datetime.utcnow().isoformat()}] {interaction.user} a supprimé la marchandise `{nom}`")
-    chan_b = await get_channel_by_name(interaction.guild, CHANNEL_BANQUE)
-    chan_m = await get_channel_by_name(interaction.guild, CHANNEL_MARCH)
-    try:
-        banque_msg = await chan_b.fetch_message(DATA.get('status_message_ids', {}).get('banque')) if chan_b else None
-        march_msg = await chan_m.fetch_message(DATA.get('status_message_ids', {}).get('marchandises')) if chan_m else None
-    except Exception:
-        banque_msg = march_msg = None
-    if banque_msg and march_msg:
-        await update_status_messages(banque_msg, march_msg, DATA)
+        merch = DATA.marchandises
+        found = nom in merch
+        if found:
+            del merch[nom]
+            mark_data_dirty()
+    if not found:
+        await interaction.followup.send(f"⚠️ La marchandise `{nom}` n'existe pas.")
+        return
+    await interaction.followup.send(f"✅ Marchandise `{nom}` supprimée.")
+    post_history(interaction.guild, f"<t:{int(time.time())}:F> {interaction.user} a supprimé la marchandise `{nom}`")
+    mark_status_dirty(interaction.guild, "marchandises")
 
 @bot.tree.command(name="marchandise_in", description="Entrée de marchandise (nom + quantité)")
+@allowed_and_in_cmds()
 @app_commands.describe(nom="Nom de la marchandise", quantite="Quantité à ajouter (entier)")
 async def marchandise_in(interaction: discord.Interaction, nom: str, quantite: int):
-    if not await check_allowed_and_channel(interaction):
-        return
     async with DATA_LOCK:
-        merch = DATA.setdefault('marchandises', {})
-        if nom not in merch:
-            await interaction.response.send_message(f"⚠️ La marchandise `{nom}` n'existe pas. Utilisez /new_marchandise pour l'ajouter.")
-            return
-        merch[nom] = merch.get(nom, 0) + quantite
-        await save_data(DATA)
-    await interaction.response.send_message(f"✅ Ajouté {quantite} x `{nom}` au stock.")
-    await post_history(interaction.guild, f"[{datetime.utcnow().isoformat()}] {interaction.user} a ajouté {quantite} x `{nom}`")
-    chan_b = await get_channel_by_name(interaction.guild, CHANNEL_BANQUE)
-    chan_m = await get_channel_by_name(interaction.guild, CHANNEL_MARCH)
-    try:
-        banque_msg = await chan_b.fetch_message(DATA.get('status_message_ids', {}).get('banque')) if chan_b else None
-        march_msg = await chan_m.fetch_message(DATA.get('status_message_ids', {}).get('marchandises')) if chan_m else None
-    except Exception:
-        banque_msg = march_msg = None
-    if banque_msg and march_msg:
-        await update_status_messages(banque_msg, march_msg, DATA)
+        merch = DATA.marchandises
+        found = nom in merch
+        if found:
+            merch[nom] = merch.get(nom, 0) + quantite
+            mark_data_dirty()
+    if not found:
+        await interaction.followup.send(f"⚠️ La marchandise `{nom}` n'existe pas. Utilisez /new_marchandise pour l'ajouter.")
+        return
+    await interaction.followup.send(f"✅ Ajouté {quantite} x `{nom}` au stock.")
+    post_history(interaction.guild, f"<t:{int(time.time())}:F> {interaction.user} a ajouté {quantite} x `{nom}`")
+    mark_status_dirty(interaction.guild, "marchandises")
 
 @bot.tree.command(name="marchandise_out", description="Sortie de marchandise (nom + quantité)")
+@allowed_and_in_cmds()
 @app_commands.describe(nom="Nom de la marchandise", quantite="Quantité à retirer (entier)")
 async def marchandise_out(interaction: discord.Interaction, nom: str, quantite: int):
-    if not await check_allowed_and_channel(interaction):
-        return
     async with DATA_LOCK:
-        merch = DATA.setdefault('marchandises', {})
-        if nom not in merch:
-            await interaction.response.send_message(f"⚠️ La marchandise `{nom}` n'existe pas.")
-            return
-        merch[nom] = max(0, merch.get(nom, 0) - quantite)
-        await save_data(DATA)
-    await interaction.response.send_message(f"✅ Retiré {quantite} x `{nom}` du stock.")
-    await post_history(interaction.guild, f"[{datetime.utcnow().isoformat()}] {interaction.user} a retiré {quantite} x `{nom}`")
-    chan_b = await get_channel_by_name(interaction.guild, CHANNEL_BANQUE)
-    chan_m = await get_channel_by_name(interaction.guild, CHANNEL_MARCH)
-    try:
-        banque_msg = await chan_b.fetch_message(DATA.get('status_message_ids', {}).get('banque')) if chan_b else None
-        march_msg = await chan_m.fetch_message(DATA.get('status_message_ids', {}).get('marchandises')) if chan_m else None
-    except Exception:
-        banque_msg = march_msg = None
-    if banque_msg and march_msg:
-        await update_status_messages(banque_msg, march_msg, DATA)
+        merch = DATA.marchandises
+        found = nom in merch
+        if found:
+            merch[nom] = max(0, merch.get(nom, 0) - quantite)
+            mark_data_dirty()
+    if not found:
+        await interaction.followup.send(f"⚠️ La marchandise `{nom}` n'existe pas.")
+        return
+    await interaction.followup.send(f"✅ Retiré {quantite} x `{nom}` du stock.")
+    post_history(interaction.guild, f"<t:{int(time.time())}:F> {interaction.user} a retiré {quantite} x `{nom}`")
+    mark_status_dirty(interaction.guild, "marchandises")
 
 # -------------------- CLEAN COMMANDS --------------------
 
 @bot.tree.command(name="clean_propre", description="Remettre à zéro l'argent propre")
+@allowed_and_in_cmds()
 async def clean_propre(interaction: discord.Interaction):
-    if not await check_allowed_and_channel(interaction):
-        return
     async with DATA_LOCK:
-        DATA['propre'] = 0
-        await save_data(DATA)
-    await interaction.response.send_message("✅ Argent propre remis à zéro.")
-    await post_history(interaction.guild, f"[{datetime.utcnow().isoformat()}] {interaction.user} a remis à zéro l'argent propre")
-    chan_b = await get_channel_by_name(interaction.guild, CHANNEL_BANQUE)
-    chan_m = await get_channel_by_name(interaction.guild, CHANNEL_MARCH)
-    try:
-        banque_msg = await chan_b.fetch_message(DATA.get('status_message_ids', {}).get('banque')) if chan_b else None
-        march_msg = await chan_m.fetch_message(DATA.get('status_message_ids', {}).get('marchandises')) if chan_m else None
-    except Exception:
-        banque_msg = march_msg = None
-    if banque_msg and march_msg:
-        await update_status_messages(banque_msg, march_msg, DATA)
+        DATA.propre = 0
+        mark_data_dirty()
+    await interaction.followup.send("✅ Argent propre remis à zéro.")
+    post_history(interaction.guild, f"<t:{int(time.time())}:F> {interaction.user} a remis à zéro l'argent propre")
+    mark_status_dirty(interaction.guild, "banque")
 
 @bot.tree.command(name="clean_sale", description="Remettre à zéro l'argent sale")
+@allowed_and_in_cmds()
 async def clean_sale(interaction: discord.Interaction):
-    if not await check_allowed_and_channel(interaction):
-        return
     async with DATA_LOCK:
-        DATA['sale'] = 0
-        await save_data(DATA)
-    await interaction.response.send_message("✅ Argent sale remis à zéro.")
-    await post_history(interaction.guild, f"[{datetime.utcnow().isoformat()}] {interaction.user} a remis à zéro l'argent sale")
-    chan_b = await get_channel_by_name(interaction.guild, CHANNEL_BANQUE)
-    chan_m = await get_channel_by_name(interaction.guild, CHANNEL_MARCH)
-    try:
-        banque_msg = await chan_b.fetch_message(DATA.get('status_message_ids', {}).get('banque')) if chan_b else None
-        march_msg = await chan_m.fetch_message(DATA.get('status_message_ids', {}).get('marchandises')) if chan_m else None
-    except Exception:
-        banque_msg = march_msg = None
-    if banque_msg and march_msg:
-        await update_status_messages(banque_msg, march_msg, DATA)
+        DATA.sale = 0
+        mark_data_dirty()
+    await interaction.followup.send("✅ Argent sale remis à zéro.")
+    post_history(interaction.guild, f"<t:{int(time.time())}:F> {interaction.user} a remis à zéro l'argent sale")
+    mark_status_dirty(interaction.guild, "banque")
 
 @bot.tree.command(name="clean_marchandise", description="Remettre à zéro une marchandise (nom)")
+@allowed_and_in_cmds()
 @app_commands.describe(nom="Nom de la marchandise")
 async def clean_marchandise(interaction: discord.Interaction, nom: str):
-    if not await check_allowed_and_channel(interaction):
-        return
     async with DATA_LOCK:
-        merch = DATA.setdefault('marchandises', {})
-        if nom not in merch:
-            await interaction.response.send_message(f"⚠️ La marchandise `{nom}` n'existe pas.")
-            return
-        merch[nom] = 0
-        await save_data(DATA)
-    await interaction.response.send_message(f"✅ Quantité de `{nom}` remise à zéro.")
-    await post_history(interaction.guild, f"[{datetime.utcnow().isoformat()}] {interaction.user} a remis à zéro `{nom}`")
-    chan_b = await get_channel_by_name(interaction.guild, CHANNEL_BANQUE)
-    chan_m = await get_channel_by_name(interaction.guild, CHANNEL_MARCH)
-    try:
-        banque_msg = await chan_b.fetch_message(DATA.get('status_message_ids', {}).get('banque')) if chan_b else None
-        march_msg = await chan_m.fetch_message(DATA.get('status_message_ids', {}).get('marchandises')) if chan_m else None
-    except Exception:
-        banque_msg = march_msg = None
-    if banque_msg and march_msg:
-        await update_status_messages(banque_msg, march_msg, DATA)
+        merch = DATA.marchandises
+        found = nom in merch
+        if found:
+            merch[nom] = 0
+            mark_data_dirty()
+    if not found:
+        await interaction.followup.send(f"⚠️ La marchandise `{nom}` n'existe pas.")
+        return
+    await interaction.followup.send(f"✅ Quantité de `{nom}` remise à zéro.")
+    post_history(interaction.guild, f"<t:{int(time.time())}:F> {interaction.user} a remis à zéro `{nom}`")
+    mark_status_dirty(interaction.guild, "marchandises")
 
 @bot.tree.command(name="clean_marchandise_all", description="Remettre à zéro toutes les marchandises")
+@allowed_and_in_cmds()
 async def clean_marchandise_all(interaction: discord.Interaction):
-    if not await check_allowed_and_channel(interaction):
-        return
     async with DATA_LOCK:
-        DATA['marchandises'] = {k:0 for k in DATA.get('marchandises', {})}
-        await save_data(DATA)
-    await interaction.response.send_message("✅ Toutes les marchandises ont été remises à zéro.")
-    await post_history(interaction.guild, f"[{datetime.utcnow().isoformat()}] {interaction.user} a remis à zéro toutes les marchandises")
-    chan_b = await get_channel_by_name(interaction.guild, CHANNEL_BANQUE)
-    chan_m = await get_channel_by_name(interaction.guild, CHANNEL_MARCH)
-    try:
-        banque_msg = await chan_b.fetch_message(DATA.get('status_message_ids', {}).get('banque')) if chan_b else None
-        march_msg = await chan_m.fetch_message(DATA.get('status_message_ids', {}).get('marchandises')) if chan_m else None
-    except Exception:
-        banque_msg = march_msg = None
-    if banque_msg and march_msg:
-        await update_status_messages(banque_msg, march_msg, DATA)
+        DATA.marchandises = {k:0 for k in DATA.marchandises}
+        mark_data_dirty()
+    await interaction.followup.send("✅ Toutes les marchandises ont été remises à zéro.")
+    post_history(interaction.guild, f"<t:{int(time.time())}:F> {interaction.user} a remis à zéro toutes les marchandises")
+    mark_status_dirty(interaction.guild, "marchandises")
 
 # -------------------- RUN --------------------
 